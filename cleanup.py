@@ -22,14 +22,17 @@ def cleanup(tc_directory: PathLike | str, force: bool = False) -> Tuple[TcFile,
 
 
 def remove_annotations_from_path(path: Dict[str, Any]):
-    path.pop('start_long', '')
-    path.pop('end_long', '')
-    path.pop('sinuosity', 0)
-    if "maxSpeed" in path and path.get("maxSpeed") == 0:
-        path.pop("maxSpeed")
-    if 'objects' in path:
-        for sub_path in path['objects']:
-            remove_annotations_from_path(sub_path)
+    # Use an explicit stack instead of recursing into the sub-paths
+    paths = [path]
+    while paths:
+        path = paths.pop()
+        path.pop('start_long', None)
+        path.pop('end_long', None)
+        path.pop('sinuosity', None)
+        if path.get("maxSpeed", None) == 0:
+            path.pop("maxSpeed")
+        if 'objects' in path:
+            paths.extend(path['objects'])
 
 
 def remove_annotations_from_station(station: Dict[str, Any], force: bool = False):
@@ -47,9 +47,11 @@ def process_station_input(stations: List[str],
                           ) -> List[str]:
     parsed_station_codes = parse_station_input(stations, case_sensitive=case_sensitive)
     station_codes = []
+    stations_to_merge = []
     for equivalent_stations in parsed_station_codes:
-        dataset.merge_station(equivalent_stations)
+        stations_to_merge.append(equivalent_stations)
         station_codes.append(equivalent_stations[0])
+    dataset.merge_stations_bulk(stations_to_merge)
     return station_codes
 
 
@@ -4,6 +4,7 @@ from functools import lru_cache
 from typing import Callable, Tuple
 
 import geopy.distance
+import numpy as np
 import pyproj
 from pyproj.enums import TransformDirection
 
@@ -25,6 +26,10 @@ class Location:
     latitude: float
     longitude: float
 
+    def __reduce__(self):
+        # The default pickling of __slots__ uses setattr, which isn't allowed on frozen dataclasses
+        return Location, (self.latitude, self.longitude)
+
     def to_tc(self) -> Tuple[int, int]:
         x = int((self.longitude - origin_x_tc) * scale_x_tc)
         y = int((self.latitude - origin_y_tc) * scale_y_tc)
@@ -142,6 +147,30 @@ class Location:
         return ('location', self.latitude, self.longitude).__hash__()
 
 
+earth_radius_km = 6371.0
+
+
+def haversine_distances(latitudes: np.ndarray, longitudes: np.ndarray,
+                        latitude: float, longitude: float) -> np.ndarray:
+    """Great-circle distances in km from all given coordinates (in degrees) to one location"""
+    latitudes = np.radians(latitudes)
+    latitude = np.radians(latitude)
+    delta_latitudes = latitudes - latitude
+    delta_longitudes = np.radians(longitudes) - np.radians(longitude)
+    a = np.sin(delta_latitudes / 2) ** 2 + np.cos(latitudes) * np.cos(latitude) * np.sin(delta_longitudes / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(a))
+
+
+def haversine_path_distances(latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km between consecutive coordinates (in degrees) of a path"""
+    latitudes = np.radians(latitudes)
+    delta_latitudes = np.diff(latitudes)
+    delta_longitudes = np.diff(np.radians(longitudes))
+    a = np.sin(delta_latitudes / 2) ** 2 \
+        + np.cos(latitudes[:-1]) * np.cos(latitudes[1:]) * np.sin(delta_longitudes / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(a))
+
+
 location_kdn = Location(
     latitude=50.809494066048444,
     longitude=6.48224930984118
@@ -1,18 +1,15 @@
 from __future__ import annotations
 
-import itertools
 import logging
+import math
 import time
 from typing import Any, Dict, List, Iterator
 
 # https://towardsdatascience.com/loading-data-from-openstreetmap-with-python-and-the-overpass-api-513882a27fd0
 from urllib.parse import urlencode, quote
 
-import geopy.distance
 import numpy as np
-import rdp
 import requests
-from gpxpy.gpx import GPXTrackPoint
 from requests import Response
 
 
@@ -95,16 +92,17 @@ def create_query(query: str,
     return f"[out:json];{timeout}{maxsize}{query};out {out};"
 
 
-def query_around_gpx(distance: float, path: List[GPXTrackPoint], ndigits=4) -> str:
-    lat_lons = (f"{round(trackpoint.latitude, ndigits)},{round(trackpoint.longitude, ndigits)}" for trackpoint in path)
+def query_around_gpx(distance: float, path: np.ndarray, ndigits=4) -> str:
+    """path is an array of (latitude, longitude)"""
+    lat_lons = (f"{round(latitude, ndigits)},{round(longitude, ndigits)}" for latitude, longitude in path.tolist())
     lat_lons = ','.join(lat_lons)
     return f"(around:{int(distance * 1000)},{lat_lons})"
 
 
 def query_rail_around_gpx(distance: float,
-                          segment: List[GPXTrackPoint],
+                          segment: np.ndarray,
                           only_maxspeed: bool = False) -> str:
-    segment = list(douglas_peucker(segment, distance))
+    segment = douglas_peucker(segment, distance)
     only_maxspeed = '["maxspeed"]' if only_maxspeed else ""
     around = query_around_gpx(distance, segment)
     query = f'way["railway"="rail"]{only_maxspeed}{around}'
@@ -112,27 +110,57 @@ def query_rail_around_gpx(distance: float,
 
 
 def query_stations_around_gpx(distance: float,
-                              path: List[GPXTrackPoint]) -> str:
-    path = list(douglas_peucker(path, min(0.01, distance - 0.03)))
+                              path: np.ndarray) -> str:
+    path = douglas_peucker(path, min(0.01, distance - 0.03))
     around = query_around_gpx(distance, path, ndigits=5)
     query = f'node["railway"="station"]{around}'
     return query
 
 
+# Equirectangular approximation, see https://en.wikipedia.org/wiki/Latitude#Length_of_a_degree_of_latitude
+km_per_latitude = 110.574
+km_per_longitude_at_equator = 111.320
+
+
 # Based on https://towardsdatascience.com/simplify-polylines-with-the-douglas-peucker-algorithm-ac8ed487a4a1
-def douglas_peucker(points: List[GPXTrackPoint], max_radius: float) -> Iterator[GPXTrackPoint]:
-    points_array = np.ndarray((len(points), 2), dtype=float)
-    for index, point in enumerate(points):
-        # We use lat, lon here, because geopy.distance.geodesic uses this format.
-        # For the geometric stuff it doesn't matter, as we only care about distances and not directions, etc.
-        points_array[index] = (point.latitude, point.longitude)
-    selected_points = rdp.rdp(points_array, dist=approximate_distance_to_line, epsilon=max_radius, return_mask=True)
-    return itertools.compress(points, selected_points)
-
-
-def approximate_distance_to_line(point: np.ndarray, start: np.ndarray, end: np.ndarray) -> float:
-    # NOTE: We assume here that distances are roughly linear to the longitude and latitude difference
-    # Step 1: Get the "scale" - i.e., distance_km / distance_lon_lat.
-    km_per_lon_lat = geopy.distance.geodesic(start, end).km / np.linalg.norm(start - end)
-    distance_lon_lat = rdp.pldist(point, start, end)
-    return distance_lon_lat * km_per_lon_lat
+def douglas_peucker(points: np.ndarray, max_radius: float) -> np.ndarray:
+    """points is an array of (latitude, longitude)"""
+    latitudes = points[:, 0]
+    longitudes = points[:, 1]
+    # NOTE: We assume here that distances are roughly linear to the longitude and latitude difference,
+    # i.e., we use an equirectangular projection around the mean latitude to get the coordinates in km.
+    km_per_longitude = km_per_longitude_at_equator * math.cos(math.radians(latitudes.mean()))
+    points_km = np.column_stack((latitudes * km_per_latitude, longitudes * km_per_longitude))
+    return points[douglas_peucker_mask(points_km, max_radius)]
+
+
+def douglas_peucker_mask(points: np.ndarray, epsilon: float) -> np.ndarray:
+    """Returns a mask of the points to keep. Iterative (with an explicit stack) to avoid deep recursions, and the
+    distances to a line are calculated for all points of a segment at once"""
+    mask = np.zeros(len(points), dtype=bool)
+    if not len(points):
+        return mask
+    mask[0] = True
+    mask[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        direction = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(direction[0], direction[1])
+        if length == 0:
+            # Start and end are the same, so we just use the distance to that point
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            # The cross product is the area of the parallelogram, i.e., the distance times the length of the line
+            distances = np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        index = int(distances.argmax())
+        if distances[index] > epsilon:
+            split = start + 1 + index
+            mask[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return mask
+
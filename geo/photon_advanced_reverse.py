@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import collections.abc
+import os.path
+import shelve
+import threading
 from functools import partial
-from typing import List
+from typing import List, Callable, Any, Dict
 from urllib.parse import urlencode
 
 import geopy
@@ -80,3 +83,59 @@ class PhotonAdvancedReverse(Photon):
         geopy.util.logger.debug("%s.reverse: %s", self.__class__.__name__, url)
         callback = partial(self._parse_json, exactly_one=exactly_one)
         return self._call_geocoder(url, callback, timeout=timeout)
+
+
+default_cache_directory = os.path.join(os.path.expanduser('~'), '.cache', 'traincompany-tools')
+
+
+class CachedReverse:
+    """Persistent cache for reverse lookups with PhotonAdvancedReverse.
+    Only the raw Photon responses are stored (and not the geopy.Location objects) to stay independent of the geopy
+    version. The points are rounded to ndigits, i.e., with the default of 5 to about one meter."""
+    reverse: Callable[..., geopy.location.Location | List[geopy.location.Location] | None]
+    geolocator: PhotonAdvancedReverse
+    ndigits: int
+
+    def __init__(self,
+                 reverse: Callable[..., geopy.location.Location | List[geopy.location.Location] | None],
+                 geolocator: PhotonAdvancedReverse,
+                 cache_directory: str = default_cache_directory,
+                 ndigits: int = 5):
+        self.reverse = reverse
+        self.geolocator = geolocator
+        self.ndigits = ndigits
+        os.makedirs(cache_directory, exist_ok=True)
+        self._cache = shelve.open(os.path.join(cache_directory, 'photon_reverse'))
+        # The lookups may happen in multiple threads, but shelve is not thread-safe
+        self._lock = threading.Lock()
+
+    def __call__(self, query: geopy.Point, **kwargs) -> geopy.location.Location | List[geopy.location.Location] | None:
+        exactly_one = kwargs.get('exactly_one', True)
+        # The timeout doesn't change the result
+        key_args = sorted((key, value) for key, value in kwargs.items() if key != 'timeout')
+        key = repr((round(query.latitude, self.ndigits), round(query.longitude, self.ndigits), key_args))
+        with self._lock:
+            response: Dict[str, Any] | None = self._cache.get(key)
+        if response is None:
+            result = self.reverse(query, **kwargs)
+            if result is None:
+                # This might also be a swallowed timeout or network error, so we don't want to keep it
+                return None
+            elif exactly_one:
+                features = [result.raw]
+            else:
+                features = [location.raw for location in result]
+            response = {'features': features}
+            with self._lock:
+                self._cache[key] = response
+        return self.geolocator._parse_json(response, exactly_one=exactly_one)
+
+    def close(self):
+        with self._lock:
+            self._cache.close()
+
+    def __enter__(self) -> CachedReverse:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
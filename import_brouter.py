@@ -26,14 +26,16 @@ def import_gpx_into_tc(gpx: PathLike | str,
                        use_overpass: bool = True,
                        use_waypoint_location: bool = False,
                        raw_waypoint_prefix: str | None = None,
-                       check_country: bool = True
+                       check_country: bool = True,
+                       use_cache: bool = True
                        ) -> Tuple[TcFile, TcFile]:
     data_set = DataSet.load_data(data_directory)
     importer = BrouterImporterNew(data_set.station_data, language=language, fallback_town=fallback_town,
                                   path_tolerance=tolerance, use_overpass=use_overpass,
                                   use_waypoint_locations=use_waypoint_location, prefix_raw=raw_waypoint_prefix,
                                   raw=raw_waypoint_prefix is not None,
-                                  check_country=check_country)
+                                  check_country=check_country,
+                                  use_cache=use_cache)
     stations, paths = importer.import_data(gpx)
 
     path = TcPath.merge(paths)
@@ -79,6 +81,8 @@ if __name__ == '__main__':
                         help="Fügt nicht existierende Stationen mit dem Präfix hinzu (nur für Fähren empfohlen)")
     parser.add_argument("--no-check-country", action="store_true",
                         help="Prüft beim Abgleich mit den Datensätzen nicht, ob das Land übereinstimmt")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Verwendet keine zwischengespeicherten Ergebnisse von Photon")
     args = parser.parse_args()
     use_default_cli_args(args)
 
@@ -95,7 +99,8 @@ if __name__ == '__main__':
         use_overpass=not args.no_overpass,
         use_waypoint_location=args.waypoint_location,
         raw_waypoint_prefix=args.raw_waypoints,
-        check_country=not args.no_check_country
+        check_country=not args.no_check_country,
+        use_cache=not args.no_cache
     )
 
     station_json.save()
@@ -37,7 +37,7 @@ def import_stations_into_tc(station_codes: List[str],
                             **kwargs) -> TcFile:
     if not data_set:
         data_set = DataSet.load_data(data_directory)
-    code_to_station = {code: station for code, station in iter_stations_by_codes_reverse(data_set.station_data)}
+    code_to_station = dict(iter_stations_by_codes_reverse(data_set.station_data))
     stations = [code_to_station[code.upper() if not case_sensitive else code] for code in
                 station_codes]
 
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 import csv
-import json
+import hashlib
+import importlib
+import inspect
 import logging
+import os
+import pickle
 from abc import ABCMeta, abstractmethod
-from typing import TypeVar, Generic, List, Optional, Any, TextIO, Generator, Iterator
+from typing import TypeVar, Generic, List, Optional, Any, TextIO, Generator, Iterator, Tuple
+
+import orjson
 
 T = TypeVar('T')
 
@@ -14,6 +20,47 @@ class Importer(Generic[T], metaclass=ABCMeta):
     def import_data(self, file_name: str) -> List[T]:
         pass
 
+    def import_data_cached(self, file_name: str) -> List[T]:
+        """Like import_data, but keeps the result in import_cache_directory"""
+        # The same file name might be used in multiple data directories
+        path_hash = hashlib.sha1(os.path.abspath(file_name).encode('utf-8')).hexdigest()[:16]
+        cache_file = os.path.join(import_cache_directory, '{}-{}-{}.pickle'.format(
+            type(self).__name__, os.path.basename(file_name), path_hash))
+        # The cache is stale if the data, the importer or the code of the imported objects has changed
+        key = (import_cache_version, _file_key(file_name), _file_key(inspect.getfile(type(self))),
+               tuple(_file_key(inspect.getfile(importlib.import_module(module))) for module in _cached_data_modules))
+        try:
+            with open(cache_file, 'rb') as cache:
+                # Check the key first, stale objects might not even be unpickled anymore
+                if pickle.load(cache) == key:
+                    return pickle.load(cache)
+        except Exception as e:
+            # Whatever is wrong with the cache, we can still import the data again
+            logging.debug("Konnte den Cache nicht lesen: {}".format(e))
+        data = self.import_data(file_name)
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file + '.tmp', 'wb') as cache:
+                pickle.dump(key, cache, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(data, cache, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_file + '.tmp', cache_file)
+        except OSError as e:
+            logging.debug("Konnte den Cache nicht schreiben: {}".format(e))
+        return data
+
+
+# Outside the data directory, which might be read-only or a git submodule
+import_cache_directory = os.path.join(os.path.expanduser('~'), '.cache', 'traincompany-tools', 'imports')
+# Increase this if the cached objects change in a way the modification times of the modules don't show
+import_cache_version = 1
+# The modules defining the imported objects (and how they are created)
+_cached_data_modules = ('importer', 'geo', 'structures.country', 'structures.station', 'structures.route')
+
+
+def _file_key(file_name: str) -> Tuple[int, int]:
+    stat = os.stat(file_name)
+    return stat.st_mtime_ns, stat.st_size
+
 
 class CsvImporter(Importer[T], metaclass=ABCMeta):
     delimiter: str
@@ -31,7 +78,8 @@ class CsvImporter(Importer[T], metaclass=ABCMeta):
 
     def import_data(self, file_name: str) -> List[T]:
         try:
-            with open(file_name, encoding=self.encoding) as csv_file:
+            # The csv module wants to handle the newlines itself
+            with open(file_name, encoding=self.encoding, newline='') as csv_file:
                 reader = csv.reader(csv_file, delimiter=self.delimiter)
                 if self.skip_first_line:
                     first_line = reader.__next__()
@@ -39,8 +87,7 @@ class CsvImporter(Importer[T], metaclass=ABCMeta):
                         self.encoding = 'utf-8'
                         logging.info("Reopening with UTF-8 encoding")
                         return self.import_data(file_name)
-                data = (self.deserialize(entry) for entry in reader)
-                data = [entry for entry in data if entry is not None]
+                data = [entry for entry in map(self.deserialize, reader) if entry is not None]
         except UnicodeDecodeError as e:
             if self.encoding != "utf-8":
                 self.encoding = "utf-8"
@@ -75,11 +122,10 @@ class JsonImporter(Importer[T], metaclass=ABCMeta):
 
     def import_data(self, file_name: str) -> List[T]:
         with open(file_name, encoding=self.encoding) as json_file:
-            content = json.load(json_file)
+            content = orjson.loads(json_file.read())
             for entry in self.top_level_entry:
                 content = content[entry]
-            data = (self.deserialize(entry) for entry in content)
-            data = [entry for entry in data if entry is not None]
+            data = [entry for entry in map(self.deserialize, content) if entry is not None]
         return data
 
 
@@ -1,28 +1,33 @@
 from __future__ import annotations
 
+import dataclasses
 import itertools
 import logging
 import random
 import re
 from collections import Counter
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from operator import itemgetter
 
 import statistics
 from time import sleep
 from typing import List, Tuple, Dict, Any, Callable
+from xml.etree import ElementTree
 
 import geopy.distance
-import gpxpy
+import numpy as np
 import unidecode
+from geopy.adapters import RequestsAdapter
 from geopy.extra.rate_limiter import RateLimiter
-from gpxpy.gpx import GPXTrackPoint, GPXWaypoint
-from networkx.utils import pairwise
+from gpxpy.gpx import GPXWaypoint
 
 import geo
-from geo import Location, overpass
+from geo import Location, overpass, haversine_distances, haversine_path_distances, earth_radius_km
 from geo.overpass import query_rail_around_gpx, request_overpass, douglas_peucker, create_query, \
     query_stations_around_gpx
-from geo.photon_advanced_reverse import PhotonAdvancedReverse
+from geo.photon_advanced_reverse import PhotonAdvancedReverse, CachedReverse
 from structures.country import countries
 from structures.route import TcPath, TrackKind, sinousity_to_twisting_factor
 from structures.station import Station, CodeTuple, Platform
@@ -31,6 +36,9 @@ from structures.station import Station, CodeTuple, Platform
 class BrouterImporterNew:
     stations: List[Station]
     name_to_station: Dict[str, Station]
+    # id(station) -> index in stations
+    station_indices: Dict[int, int]
+    geolocator: PhotonAdvancedReverse
     language: str | bool
     fallback_town: bool
     fail_on_unknown: bool
@@ -41,6 +49,8 @@ class BrouterImporterNew:
     raw: bool
     prefix_raw: str
     check_country: bool = True
+    max_parallel_requests: int = 4
+    use_cache: bool = True
 
     def __init__(self, station_data: List[Station],
                  language: str | bool = False,
@@ -52,10 +62,15 @@ class BrouterImporterNew:
                  use_waypoint_locations: bool = True,
                  raw: bool = False,
                  prefix_raw: str = "STATION",
-                 check_country: bool = True):
+                 check_country: bool = True,
+                 max_parallel_requests: int = 4,
+                 use_cache: bool = True):
         self.stations = station_data
         self.name_to_station = {normalize_name(station.name): station
                                 for station in station_data}
+        self.station_indices = {id(station): index for index, station in enumerate(station_data)}
+        # The requests adapter keeps a session, i.e., the connection is reused for all requests of this geocoder
+        self.geolocator = PhotonAdvancedReverse(timeout=10, adapter_factory=RequestsAdapter)
         self.language = language
         self.fallback_town = fallback_town
         self.fail_on_unknown = fail_on_unknown
@@ -66,26 +81,26 @@ class BrouterImporterNew:
         self.raw = raw
         self.prefix_raw = prefix_raw
         self.check_country = check_country
+        self.max_parallel_requests = max_parallel_requests
+        self.use_cache = use_cache
 
     def import_data(self, file_name: str) -> Tuple[List[Station], List[TcPath]]:
-        with open(file_name, encoding='utf-8') as input_file:
-            gpx = gpxpy.parse(input_file)
+        trackpoints, waypoints = parse_gpx(file_name)
 
         # Step 1: Find the OSM railway stations for all waypoints
-        geolocator = PhotonAdvancedReverse()
-        reverse = RateLimiter(geolocator.reverse, min_delay_seconds=0.5, max_retries=3)
+        reverse = RateLimiter(self.geolocator.reverse, min_delay_seconds=0.5, max_retries=3)
 
         max_distance_waypoint_to_track = 0.08
 
-        if not gpx.waypoints:
-            gpx.waypoints = self.collect_waypoints_from_trackpoints(gpx.tracks[0].segments[0].points,
-                                                                    8)
+        if not waypoints:
+            waypoints = self.collect_waypoints_from_trackpoints(trackpoints, 8)
             max_distance_waypoint_to_track = self.path_tolerance
             sleep(10)
 
-        waypoint_location_to_station_location = self.collect_waypoint_stations(gpx.waypoints, reverse)
+        with CachedReverse(reverse, self.geolocator) if self.use_cache else nullcontext(reverse) as reverse:
+            waypoint_location_to_station_location = self.collect_waypoint_stations(waypoints, reverse)
 
-        path_segments, stops = self.collect_path_segments(gpx.tracks[0].segments[0].points,
+        path_segments, stops = self.collect_path_segments(trackpoints,
                                                           waypoint_location_to_station_location,
                                                           max_distance_waypoint_to_track)
 
@@ -100,32 +115,50 @@ class BrouterImporterNew:
                        for (start, segment, end), overpass_response in zip(path_segments, overpass_responses)]
 
     @staticmethod
-    def collect_path_segments(points: List[GPXTrackPoint],
+    def collect_path_segments(points: np.ndarray,
                               waypoint_location_to_station_location: Dict[Location, Station],
                               max_distance: float = 0.08) \
-            -> Tuple[List[Tuple[Station, List[GPXTrackPoint], Station]], List[Station]]:
+            -> Tuple[List[Tuple[Station, np.ndarray, Station]], List[Station]]:
         # Now we go through the trackpoints and add stations and segments
-        path_segments: List[Tuple[Station, List[GPXTrackPoint], Station]] = []
+        path_segments: List[Tuple[Station, np.ndarray, Station]] = []
         # Collect the visited stations here
         stops: List[Station] = []
         # The index in the track segment where the last stop was located
         last_stop_index: int = 0
         last_stop: Station | None = None
-        for index, trackpoint in enumerate(points):
-            location = Location(
-                latitude=trackpoint.latitude,
-                longitude=trackpoint.longitude
-            )
+        # Find the trackpoints close to each waypoint first, so that we only need to look at those trackpoints
+        latitudes = points[:, 0]
+        longitudes = points[:, 1]
+        waypoint_locations = list(waypoint_location_to_station_location.keys())
+        waypoint_stations = list(waypoint_location_to_station_location.values())
+        # A trackpoint can't be closer than its difference in latitude, so we only need to check a latitude window
+        order = np.argsort(latitudes, kind='stable')
+        sorted_latitudes = latitudes[order]
+        max_delta_latitude = np.degrees(max_distance / earth_radius_km)
+        # The waypoints (by index, in ascending order) close to each trackpoint
+        waypoints_close_to_trackpoint: Dict[int, List[int]] = {}
+        for waypoint_index, waypoint_location in enumerate(waypoint_locations):
+            start = np.searchsorted(sorted_latitudes, waypoint_location.latitude - max_delta_latitude, side='left')
+            end = np.searchsorted(sorted_latitudes, waypoint_location.latitude + max_delta_latitude, side='right')
+            candidates = order[start:end]
+            distances = haversine_distances(latitudes[candidates], longitudes[candidates],
+                                            waypoint_location.latitude, waypoint_location.longitude)
+            for index in candidates[np.flatnonzero(distances < max_distance)]:
+                waypoints_close_to_trackpoint.setdefault(int(index), []).append(waypoint_index)
+        # We don't want to match a stop multiple times, so we keep track of the ones not visited yet
+        pending = [True] * len(waypoint_locations)
+        for index in sorted(waypoints_close_to_trackpoint):
             # Check if this trackpoint is a stop
-            for waypoint_location, stop in waypoint_location_to_station_location.items():
-                if waypoint_location.distance_float(location) < max_distance:
+            for waypoint_index in waypoints_close_to_trackpoint[index]:
+                if pending[waypoint_index]:
+                    pending[waypoint_index] = False
+                    stop = waypoint_stations[waypoint_index]
                     # We have a stop here, add it to the list
+                    # The segment is a view on the points, not a copy
                     path_segments.append((last_stop, points[last_stop_index:index], stop))
                     last_stop_index = index
                     last_stop = stop
                     stops.append(stop)
-                    # We don't want to match the stop multiple times
-                    waypoint_location_to_station_location.pop(waypoint_location)
                     break
         # The first entry is garbage
         path_segments.pop(0)
@@ -133,7 +166,7 @@ class BrouterImporterNew:
 
         return path_segments, stops
 
-    def collect_waypoints_from_trackpoints(self, points: List[GPXTrackPoint],
+    def collect_waypoints_from_trackpoints(self, points: np.ndarray,
                                            min_distance_between_station: float = 2.0) -> List[GPXWaypoint]:
         query = query_stations_around_gpx(self.path_tolerance, points)
         query = create_query(query, out="skel")
@@ -154,16 +187,14 @@ class BrouterImporterNew:
         waypoint_location_to_station_location = {}
 
         raw_stations = 1
-        for waypoint in waypoints:
-            # Find stations close to the given waypoint location
-            possible_stations: List[geopy.location.Location] | None = geocode_reverse(
-                geopy.Point(latitude=waypoint.latitude, longitude=waypoint.longitude),
-                exactly_one=False,
-                limit=6,
-                query_string_filter='+'.join(["osm_value:stop", "osm_value:station", "osm_value:halt"]),
-                language=self.language,
-                timeout=10
-            )
+        # Find stations close to the given waypoint locations
+        all_possible_stations = self.reverse_waypoints(
+            waypoints, geocode_reverse,
+            query_string_filter='+'.join(["osm_value:stop", "osm_value:station", "osm_value:halt"])
+        )
+        for waypoint, possible_stations in zip(waypoints, all_possible_stations):
+            # The station from the data set, if we found one
+            existing_station: Station | None = None
             if possible_stations is None:
                 if self.fallback_town:
                     logging_fn = logging.info
@@ -234,13 +265,15 @@ class BrouterImporterNew:
                             logging.error("Ignoring station")
                         continue
 
+            # Normalize the names once (normalize_name is cached, so repeated responses are cheap as well)
+            possible_station_names: List[Tuple[str, geopy.location.Location]] = []
             for possible_station in possible_stations:
-                if 'name' not in possible_station.raw['properties']:
+                if 'name' in possible_station.raw['properties']:
+                    possible_station_names.append((normalize_name(possible_station.raw['properties']['name']),
+                                                   possible_station))
+                else:
                     logging.info("Station ohne Namen: {}".format(possible_station.raw))
 
-            possible_station_names = ((normalize_name(station.raw['properties']['name']),
-                                       station)
-                                      for station in possible_stations if 'name' in station.raw['properties'])
             possible_station_groups = [group_from_photon_response(station.raw['properties']) for station in
                                        possible_stations]
             # Is one of these names in our data set?
@@ -267,21 +300,18 @@ class BrouterImporterNew:
                             continue
                     # Remove it from the lookup table to prevent having the same station twice
                     self.name_to_station.pop(name)
+                    existing_station = station
                     # Add this location if necessary
-                    if station.location is None or station.group == -1 or self.use_waypoint_locations:
-                        station_dict = station.__dict__
-                        station_dict.pop("country", None)
-                        station_dict.pop("point", None)
-                        station_dict.pop("platform_length", None)
-                        station_dict.pop("platform_count", None)
-                        if station.location is None or self.use_waypoint_locations:
-                            station_dict["location"] = Location(
-                                latitude=waypoint.latitude,
-                                longitude=waypoint.longitude
-                            )
-                        if station.group == -1:
-                            station_dict["_group"] = largest_group(possible_station_groups)
-                        station = Station(**station_dict)
+                    changes: Dict[str, Any] = {}
+                    if station.location is None or self.use_waypoint_locations:
+                        changes["location"] = Location(
+                            latitude=waypoint.latitude,
+                            longitude=waypoint.longitude
+                        )
+                    if station.group == -1:
+                        changes["_group"] = largest_group(possible_station_groups)
+                    if changes:
+                        station = dataclasses.replace(station, **changes)
                     break
             else:
                 logging.info("Couldn't find any of these stations: {}. Creating new one.".format(
@@ -301,7 +331,8 @@ class BrouterImporterNew:
                     code = f"{country.flag}{self.prefix_raw}{raw_stations}"
                     raw_stations += 1
                 # It might be longer than the limit...
-                assert len(bytes(code, "utf-8")) <= 20
+                # The flag is not ASCII, so we need to check the length of the encoded code
+                assert len(code.encode("utf-8")) <= 20, code
 
                 # Assemble the station with all data we have
                 station = Station(
@@ -319,19 +350,74 @@ class BrouterImporterNew:
                 logging.debug(f"New station: {station}")
 
             if station.platform_length == 0 and self.get_platform_data and not station.country.iso_3166 == "UN":
-                station = with_osm_platform_data(station)
+                station = with_osm_platform_data(station, self.geolocator)
 
             # Add to the data set (it should propagate to the original data set as well)
-            self.stations.append(station)
+            if existing_station is None:
+                self.stations.append(station)
+            elif station is not existing_station:
+                # Replace the existing station instead of adding it twice
+                index = self.station_indices.pop(id(existing_station))
+                self.stations[index] = station
+                self.station_indices[id(station)] = index
             # We do not want to add it to the lookup table to ensure that we only have unique stations
 
             waypoint_location_to_station_location[Location(longitude=waypoint.longitude,
                                                            latitude=waypoint.latitude)] = station
         return waypoint_location_to_station_location
 
+    def reverse_waypoints(self, waypoints: List[GPXWaypoint],
+                          geocode_reverse,
+                          query_string_filter: str) -> List[List[geopy.location.Location] | None]:
+        """Looks up all waypoints concurrently.
+        The (thread-safe) rate limiter is shared between the workers, so the requests are still started with the
+        minimum delay, but we don't have to wait for each response before sending the next request."""
+        def reverse_waypoint(waypoint: GPXWaypoint) -> List[geopy.location.Location] | None:
+            return geocode_reverse(
+                geopy.Point(latitude=waypoint.latitude, longitude=waypoint.longitude),
+                exactly_one=False,
+                limit=6,
+                query_string_filter=query_string_filter,
+                language=self.language,
+                timeout=10
+            )
 
-def with_osm_platform_data(station: Station) -> Station:
-    geolocator = geopy.Photon(timeout=10)
+        with ThreadPoolExecutor(max_workers=self.max_parallel_requests) as executor:
+            return list(executor.map(reverse_waypoint, waypoints))
+
+
+gpx_lat_lon = itemgetter('lat', 'lon')
+
+
+def parse_gpx(file_name: str) -> Tuple[np.ndarray, List[GPXWaypoint]]:
+    """Reads the points of the first track segment as an array of (latitude, longitude) and the waypoints.
+    This is much faster than gpxpy.parse, which creates an object for every single trackpoint."""
+    latitudes: List[float] = []
+    longitudes: List[float] = []
+    waypoints: List[GPXWaypoint] = []
+    first_segment_finished = False
+    for _, element in ElementTree.iterparse(file_name):
+        # Ignore the namespace
+        tag = element.tag.rpartition('}')[2]
+        if tag == 'trkpt':
+            if not first_segment_finished:
+                latitude, longitude = gpx_lat_lon(element.attrib)
+                latitudes.append(float(latitude))
+                longitudes.append(float(longitude))
+            element.clear()
+        elif tag == 'trkseg':
+            first_segment_finished = True
+        elif tag == 'wpt':
+            latitude, longitude = gpx_lat_lon(element.attrib)
+            waypoints.append(GPXWaypoint(latitude=float(latitude), longitude=float(longitude)))
+            element.clear()
+    return np.column_stack((np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64))), \
+        waypoints
+
+
+def with_osm_platform_data(station: Station, geolocator: geopy.Photon | None = None) -> Station:
+    if geolocator is None:
+        geolocator = geopy.Photon(timeout=10)
     geocode = RateLimiter(geolocator.geocode, min_delay_seconds=0.5, max_retries=3)
     station_location = geopy.Point(latitude=station.location.latitude,
                                    longitude=station.location.longitude)
@@ -397,17 +483,11 @@ def with_osm_platform_data(station: Station) -> Station:
             else:
                 logging.debug("Bahnsteig ohne Größe gefunden bei {}".format(station))
         if station_platforms:
-            station_dict = station.__dict__
-            station_dict.pop("platform_length", 0)
-            station_dict.pop("platform_count", 0)
-            station_dict.pop("group", 0)
-            station_dict.pop("country", None)
-            station_dict.pop("point", None)
-            if not station_dict["platforms"]:
-                station_dict["platforms"] = station_platforms
+            if not station.platforms:
+                return dataclasses.replace(station, platforms=station_platforms)
             else:
-                station_dict["_platform_length"] = max((platform.length for platform in station_platforms))
-            return Station(**station_dict)
+                return dataclasses.replace(station,
+                                           _platform_length=max((platform.length for platform in station_platforms)))
     logging.debug("Keine Bahnsteige gefunden für {}".format(station))
     return station
 
@@ -464,11 +544,9 @@ def get_group_from_overpass(overpass_tags: Dict[str, Any]) -> int | None:
         return 0
 
 
-def tc_path_from_gpx(start: Station, segment: List[GPXTrackPoint], end: Station,
+def tc_path_from_gpx(start: Station, segment: np.ndarray, end: Station,
                      overpass_response: List[Dict[str, Any]] | None = None) -> TcPath:
-    length = sum((geopy.distance.geodesic(
-        (last_trackpoint.latitude, last_trackpoint.longitude),
-        (trackpoint.latitude, trackpoint.longitude)).km for last_trackpoint, trackpoint in pairwise(segment)))
+    length = float(haversine_path_distances(segment[:, 0], segment[:, 1]).sum())
 
     if overpass_response is None:
         overpass_response = []
@@ -531,22 +609,27 @@ def tc_path_from_gpx(start: Station, segment: List[GPXTrackPoint], end: Station,
     )
 
 
-def simplify_path_with_stops(path: List[Tuple[Station, List[GPXTrackPoint], Station]], max_radius: float):
+def simplify_path_with_stops(path: List[Tuple[Station, np.ndarray, Station]], max_radius: float):
     for index, (start, segment, end) in enumerate(path):
-        path[index] = (start, list(douglas_peucker(segment, max_radius)), end)
+        path[index] = (start, douglas_peucker(segment, max_radius), end)
 
 
-delimiters = re.compile(r"[- _]", flags=re.IGNORECASE)
-omitted_tokens = re.compile(r"[.']", flags=re.IGNORECASE)
+# Delimiters are replaced by a space, the other tokens are omitted
+delimiters_and_omitted_tokens = re.compile(r"[- _.']")
 more_than_one_space = re.compile(r"\s\s+")
 
 
-@lru_cache
+def _replace_delimiter_or_omitted_token(match: re.Match) -> str:
+    return "" if match.group(0) in ".'" else " "
+
+
+@lru_cache(maxsize=100_000)
 def normalize_name(name: str) -> str:
     name = name.lower()
-    name = unidecode.unidecode(name)
-    name = delimiters.sub(" ", name)
-    name = omitted_tokens.sub("", name)
+    # Most names are ASCII anyway, so we can skip the transliteration
+    if not name.isascii():
+        name = unidecode.unidecode(name)
+    name = delimiters_and_omitted_tokens.sub(_replace_delimiter_or_omitted_token, name)
     name = more_than_one_space.sub(" ", name)
     name = name.replace("saint", "st")
     return name
@@ -1,9 +1,8 @@
 from __future__ import annotations
 
 import logging
-import statistics
-
-from typing import List, Optional, Dict
+from operator import itemgetter
+from typing import List, Optional, Dict, Tuple
 
 from importer import CsvImporter
 from structures import Station
@@ -20,15 +19,20 @@ class DbTrassenfinderImporter(CsvImporter[CodeWaypoint]):
         )
 
     def deserialize(self, entry: List[str]) -> CodeWaypoint:
+        distance_from_start, code, next_route_number, stop_kind = trassenfinder_columns(entry)
         waypoint = CodeWaypoint(
-            distance_from_start=float(entry[0].replace(',', '.')),
-            code=entry[2].replace('  ', ' '),
-            is_stop='Kundenhalt' in entry[17],
-            next_route_number=int(entry[3]) if entry[3] else None
+            distance_from_start=float(distance_from_start.replace(',', '.')),
+            code=code.replace('  ', ' '),
+            is_stop='Kundenhalt' in stop_kind,
+            next_route_number=int(next_route_number) if next_route_number else None
         )
         return waypoint
 
 
+# Distance, code, route number and kind of stop
+trassenfinder_columns = itemgetter(0, 2, 3, 17)
+
+
 def invalid_track(route_number: int) -> Track:
     logging.warning("Unbekannte Streckennr.: {}. Kann Elektrifizierung, Streckenart nicht identifizieren.".format(route_number))
     return Track(
@@ -54,14 +58,15 @@ def track_from_path(route_number: int,
                        .format(code_start, code_end))
         warning.append("    Übernehme Daten zu Elektrifizierung, Streckenklasse vom letzten Segment"
                        .format(code_start, code_end))
-    # Generate a median segment for the route number
+    # Generate a typical segment for the route number
     if not last_known_segment and route_number in path_data or last_known_segment.route_number != route_number:
-        warning.append("    Kein letztes Streckensegment bekannt. Verwende Median der Gesamtstrecke")
+        warning.append("    Kein letztes Streckensegment bekannt. Verwende häufigste Werte der Gesamtstrecke")
+        electrified, kind = path_data[route_number].predominant_track_properties
         last_known_segment = Track(
             route_number=route_number,
-            electrified=statistics.median_high((track.electrified for track in path_data[route_number].tracks)),
+            electrified=electrified,
             length=0,
-            kind=statistics.median_high((track.kind for track in path_data[route_number].tracks)),
+            kind=kind,
             from_km=None,
             to_km=None
         )
@@ -80,8 +85,13 @@ def convert_waypoints_to_route(waypoints: List[CodeWaypoint],
                                station_data: List[Station],
                                path_data: List[Path]) -> Route:
     from structures.station import CodeTuple
-    codes_to_station = {code: station for code, station in iter_stations_by_codes_reverse(station_data)}
+    codes_to_station = dict(iter_stations_by_codes_reverse(station_data))
     route_number_to_path = {path.route_numer: path for path in path_data}
+    # The kilometer of a station on a route, so we don't need to search locations_path for every waypoint
+    station_route_number_to_km: Dict[Tuple[str, int], StreckenKilometer] = {}
+    for station in station_data:
+        for location in station.locations_path:
+            station_route_number_to_km.setdefault((station.codes[0], location.route_number), location.lfd_km)
     tracks_used = []
     for (waypoint, next_waypoint) in zip(waypoints, waypoints[1:]):
         tracks_between_waypoints = []
@@ -103,21 +113,15 @@ def convert_waypoints_to_route(waypoints: List[CodeWaypoint],
             if station.locations_path and next_station.locations_path:
                 path_used: Path = route_number_to_path[waypoint.next_route_number]
                 # Now we need to get the segments, i.e. we need to figure out what tracks/segments are used
-                station_km = [location.lfd_km for location in station.locations_path
-                              if location.route_number == waypoint.next_route_number]
-                next_station_km = [location.lfd_km for location in next_station.locations_path
-                                   if location.route_number == waypoint.next_route_number]
-                if station_km and next_station_km:
-                    station_km = station_km[0]
-                    next_station_km = next_station_km[0]
+                station_km = station_route_number_to_km.get((station.codes[0], waypoint.next_route_number))
+                next_station_km = station_route_number_to_km.get((next_station.codes[0],
+                                                                  waypoint.next_route_number))
+                if station_km is not None and next_station_km is not None:
                     km_start = min(station_km, next_station_km)
                     km_end = max(station_km, next_station_km)
-                    for track in path_used.tracks:
-                        if track.from_km <= km_start <= track.to_km or track.from_km <= km_end <= track.to_km:
-                            tracks_between_waypoints.append(track)
+                    tracks_between_waypoints.extend(path_used.tracks_at(km_start, km_end))
                     assert tracks_between_waypoints
                 else:
-                    next_station_km = next_station_km[0] if next_station_km else None
                     last_known_segment = tracks_between_waypoints[-1] if tracks_between_waypoints else None
                     tracks_between_waypoints.append(track_from_path(
                         waypoint.next_route_number,
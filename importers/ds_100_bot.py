@@ -2,6 +2,7 @@ from typing import Optional, List
 
 from importer import CsvImporter
 from structures import Station, CodeTuple
+from structures.station import stable_number
 from structures.country import countries, Country
 
 
@@ -19,7 +20,7 @@ class Ds100Importer(CsvImporter[Station]):
     def deserialize(self, entry: List[str]) -> Optional[Station]:
         station = Station(
             name=entry[1].title(),
-            number=hash(self.country.colon_prefix + entry[0]),
+            number=stable_number(self.country.colon_prefix + entry[0]),
             codes=CodeTuple(self.country.flag + entry[0], self.country.colon_prefix + entry[0])
         )
 
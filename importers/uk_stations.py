@@ -4,15 +4,15 @@ from typing import Any, Optional, Dict
 
 from importer import JsonImporter
 from structures.country import countries
+from structures.station import Station, CodeTuple
 
 
-class UkStationsImporter(JsonImporter):
+class UkStationsImporter(JsonImporter[Station]):
     def __init__(self):
         super().__init__(encoding="cp1252",
                          top_level_entry=["TIPLOCDATA"])
 
-    def deserialize(self, entry: Dict[str, Any]) -> Optional["Station"]:
-        from structures import Station, CodeTuple
+    def deserialize(self, entry: Dict[str, Any]) -> Optional[Station]:
         assert isinstance(entry, dict)
         if entry['3ALPHA']:
             codes = CodeTuple('🇬🇧' + entry['3ALPHA'], '🇬🇧' + entry['TIPLOC'])
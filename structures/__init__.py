@@ -1,16 +1,17 @@
 from __future__ import annotations
 import code
+import copy
 import logging
 
 import os.path
 from dataclasses import dataclass
 from functools import cached_property
-from typing import List, Tuple, Optional, Set, Iterable
+from typing import List, Tuple, Optional, Set, Iterable, Dict
 
 from structures.country import Country, countries
 from structures.route import Track, Path, merge_tracks
 from structures.station import Station, merge_stations, assert_unique_first_code, merge_stations_on_first_code, \
-    CodeTuple, iter_stations_by_codes_reverse, _merge_station_dicts_inplace
+    CodeTuple, iter_stations_by_codes_reverse, _merge_station_dicts_inplace, stable_number, clear_cached_properties
 from geo import Location
 
 
@@ -20,8 +21,9 @@ class DataSet:
     path_data: List[Path]
 
     @cached_property
-    def codes_to_stations(self):
-        return {code: station for code, station in iter_stations_by_codes_reverse(self.station_data)}
+    def codes_to_stations(self) -> Dict[str, Station]:
+        # Because we add the last (i.e. least precise) codes first, the "better" ones will override them at the end
+        return dict(iter_stations_by_codes_reverse(self.station_data))
 
     @staticmethod
     def load_data(
@@ -31,7 +33,7 @@ class DataSet:
         from importers.db_strecken import DbStreckenImporter
 
         stations = DataSet.load_station_data(data_directory)
-        tracks = DbStreckenImporter().import_data(os.path.join(data_directory, "strecken.csv"))
+        tracks = DbStreckenImporter().import_data_cached(os.path.join(data_directory, "strecken.csv"))
         paths = merge_tracks(tracks)
 
         return DataSet(
@@ -46,24 +48,24 @@ class DataSet:
         from importers.db_bahnsteige import DbBahnsteigeImporter, add_platforms_to_stations
         from importers.db_betriebsstellen import DbBetriebsstellenImporter
 
-        stations = DbBetriebsstellenverzeichnisImporter().import_data(
+        stations = DbBetriebsstellenverzeichnisImporter().import_data_cached(
             os.path.join(data_directory, "betriebsstellen_verzeichnis.csv"))
 
         assert_unique_first_code(stations)
 
-        stations_with_location = DbBetriebsstellenImporter().import_data(
+        stations_with_location = DbBetriebsstellenImporter().import_data_cached(
             os.path.join(data_directory, "betriebsstellen.csv"))
         stations_with_location = merge_stations_on_first_code(stations_with_location)
         stations = merge_stations(stations, stations_with_location, on="codes")
 
         assert_unique_first_code(stations)
 
-        passenger_stations = DbBahnhoefeImporter().import_data(os.path.join(data_directory, "bahnhoefe.csv"))
+        passenger_stations = DbBahnhoefeImporter().import_data_cached(os.path.join(data_directory, "bahnhoefe.csv"))
         stations = merge_stations(stations, passenger_stations, on="codes")
 
         assert_unique_first_code(stations)
 
-        platforms = DbBahnsteigeImporter().import_data(os.path.join(data_directory, "bahnsteige.csv"))
+        platforms = DbBahnsteigeImporter().import_data_cached(os.path.join(data_directory, "bahnsteige.csv"))
         add_platforms_to_stations(stations, platforms)
 
         return stations
@@ -74,9 +76,9 @@ class DataSet:
         from importers.ch_betriebsstellen import ChBetriebsstellenImporter
         from importers.ch_platforms import ChPlatformsImporter
 
-        stations_ch = ChBetriebsstellenImporter().import_data(os.path.join(data_directory, "sbb_didok.csv"))
+        stations_ch = ChBetriebsstellenImporter().import_data_cached(os.path.join(data_directory, "sbb_didok.csv"))
 
-        platforms_ch = ChPlatformsImporter().import_data(os.path.join(data_directory, "sbb_platforms.csv"))
+        platforms_ch = ChPlatformsImporter().import_data_cached(os.path.join(data_directory, "sbb_platforms.csv"))
         add_platforms_to_stations(stations_ch, platforms_ch)
 
         return stations_ch
@@ -87,79 +89,10 @@ class DataSet:
         from importers.fr_platforms import FrPlatformsImporter
         from importers.fr_stations import FrStationsImporter
 
-        stations_fr = FrStationsImporter().import_data(os.path.join(data_directory, 'fr_stations.csv'))
+        stations_fr = FrStationsImporter().import_data_cached(os.path.join(data_directory, 'fr_stations.csv'))
         stations_fr = merge_stations_on_first_code(stations_fr)
-        # Manual stations
-        stations_fr.append(Station(
-            name="Baudrecourt",
-            number=hash('Baudrecourt'),
-            codes=CodeTuple("🇫🇷BDC"),
-            kind='abzw'
-        ))
-        stations_fr.append(Station(
-            name="Pasilly à Aisy",
-            number=hash("Pasilly à Aisy"),
-            codes=CodeTuple("🇫🇷PAI"),
-            location=Location(
-                latitude=47.68882057293988,
-                longitude=4.075627659435932
-            ),
-            kind='abzw'
-        ))
-        stations_fr.append(Station(
-            name="Moisenay (Crisenoy)",
-            number=hash("LGV Interconnexion Est -> Sud-Est"),
-            codes=CodeTuple("🇫🇷MOIS"),
-            location=Location(
-                latitude=48.576961786948054,
-                longitude=2.74276121315047
-            ),
-            kind='abzw'
-        ))
-        stations_fr.append(Station(
-            name="Jablines/Messy",
-            number=hash("Warum muss das alles so kompliziert sein?!"),
-            codes=CodeTuple("🇫🇷JAB"),
-            location=Location(
-                latitude=48.94902574095624,
-                longitude=2.7114885647354288
-            ),
-            kind='abzw'
-        ))
-        stations_fr.append(Station(
-            name="Vémars",
-            number=hash("Vemars"),
-            codes=CodeTuple("🇫🇷VEMARS"),
-            location=Location(
-                latitude=49.055763434522255,
-                longitude=2.5651358332731578
-            ),
-            kind='abzw'
-        ))
-        stations_fr.append(Station(
-            name="Eurotunnel UK-Terminal",
-            number=hash("EUROTUNNEL!!!!"),
-            codes=CodeTuple("🇬🇧ETUK"),
-            location=Location(
-                latitude=51.09612758903609,
-                longitude=1.139774590509386
-            )
-        ))
-        stations_fr.append(Station(
-            name="Montanay",
-            number=hash("FR:Montanay"),
-            codes=CodeTuple("🇫🇷MONT"),
-            location=Location(
-                latitude=45.8892271474285,
-                longitude=4.877505944798289
-            ),
-            kind='abzw'
-        ))
-        stations_fr.append(abzw_fr("Grenay", "GRNY", 45.649041949201745, 5.081229404359257))
-        stations_fr.append(abzw_fr("Bollène", "BLLN", 44.30218827489829, 4.7017237487605215))
-        stations_fr.append(stat_fr("Andilly", "ADY"))
-        stations_fr.append(stat_fr("Bourmont", "BMT"))
-        stations_fr.append(stat_fr("Thiaucourt", "THU", 8))
+        # Manual stations (copied, because merging stations changes them in place)
+        stations_fr.extend(copy.copy(station) for station in manual_stations_fr)
 
         platforms_fr = FrPlatformsImporter(stations_fr).import_data(os.path.join(data_directory, 'fr_platforms.csv'))
         add_platforms_to_stations(stations_fr, platforms_fr)
@@ -172,7 +105,7 @@ class DataSet:
         from importers.uk_platforms import UkPlatformImporter
         from importers.uk_stations import UkStationsImporter
 
-        stations_uk = UkStationsImporter().import_data(os.path.join(data_directory, 'uk_corpus.json'))
+        stations_uk = UkStationsImporter().import_data_cached(os.path.join(data_directory, 'uk_corpus.json'))
         # There is duplicate data for some reason
         stations_uk = merge_stations_on_first_code(stations_uk)
 
@@ -187,7 +120,7 @@ class DataSet:
     @staticmethod
     def load_station_data_us(data_directory: str = 'data') -> List[Station]:
         from importers.us_stations import UsStationImporter
-        stations_us = UsStationImporter().import_data(os.path.join(data_directory, "us_stations.wiki"))
+        stations_us = UsStationImporter().import_data_cached(os.path.join(data_directory, "us_stations.wiki"))
 
         return stations_us
 
@@ -204,7 +137,7 @@ class DataSet:
 
         trainline_csv = os.path.join(data_directory, "trainline", "stations.csv")
         if os.path.isfile(trainline_csv):
-            stations_trainline = TrainlineImporter().import_data(trainline_csv)
+            stations_trainline = TrainlineImporter().import_data_cached(trainline_csv)
             return stations_trainline
         else:
             logging.warning("Trainline-Daten nicht gefunden: {} - Ist das Repository vorhanden?".format(trainline_csv))
@@ -226,33 +159,57 @@ class DataSet:
         stations = merge_stations(stations, stations_uk, 'number')
         # US-stations are a special case as they are not in any of the other datasets.
         # Trying to merge them would only result in chaos and tears.
-        stations = stations + stations_ca
+        stations.extend(stations_ca)
         # Yes, the US datasets and Canadian datasets may have some overlap (e.g., Toronto).
         # But filtering out stations with the same name would cause even more problems
-        stations = stations + stations_us
+        stations.extend(stations_us)
 
         return stations
 
     def merge_station(self, codes_to_merge: Iterable[str]):
         """codes_to_merge also needs to be Sized"""
-        if len(codes_to_merge) > 1:
-            stations_to_merge = [self.codes_to_stations[code] for code in codes_to_merge]
-            for station in stations_to_merge:
-                try:
-                    self.station_data.remove(station)
-                except ValueError:
-                    logging.warning("Station nicht im Datensatz: {}".format(station.codes[0]))
-            station_dict = stations_to_merge.pop(0).__dict__.copy()
+        self.merge_stations_bulk([codes_to_merge])
+
+    def merge_stations_bulk(self, groups_of_codes: Iterable[Iterable[str]]):
+        """Merges the stations of each group of codes into one station, but rebuilds station_data only once.
+        The groups also need to be Sized"""
+        stations_to_remove: List[Station] = []
+        # Compare by identity instead of comparing all fields
+        ids_to_remove: Set[int] = set()
+        for codes_to_merge in groups_of_codes:
+            if len(codes_to_merge) <= 1:
+                continue
+            # Multiple codes might belong to the same station
+            stations_to_merge = list({id(station): station for station in
+                                      (self.codes_to_stations[station_code] for station_code in codes_to_merge)}.values())
+            merged_station = stations_to_merge.pop(0)
+            # Stations are compared by identity, so we can merge into the first one in place.
+            # It keeps its position and stays valid wherever it is referenced.
+            clear_cached_properties(merged_station)
             for other_station in stations_to_merge:
-                _merge_station_dicts_inplace(station_dict, other_station.__dict__, '')
-            merged_station = Station(**station_dict)
-            self.station_data.append(merged_station)
+                _merge_station_dicts_inplace(merged_station.__dict__, other_station.__dict__, '')
+            stations_to_remove.extend(stations_to_merge)
+            ids_to_remove.update(id(station) for station in stations_to_merge)
+            # Point the codes of the removed stations to the merged one (a later group might use them)
+            for station_code in merged_station.codes:
+                if id(self.codes_to_stations.get(station_code)) in ids_to_remove:
+                    self.codes_to_stations[station_code] = merged_station
+        if not ids_to_remove:
+            return
+        # Remove the stations in a single pass
+        remaining_stations = [station for station in self.station_data if id(station) not in ids_to_remove]
+        if len(self.station_data) - len(remaining_stations) != len(ids_to_remove):
+            station_ids = {id(station) for station in self.station_data}
+            for station in stations_to_remove:
+                if id(station) not in station_ids:
+                    logging.warning("Station nicht im Datensatz: {}".format(station.codes[0]))
+        self.station_data[:] = remaining_stations
 
 
 def stat_fr(name: str, code: str, category: int = 5) -> Station:
     return Station(
         name=name,
-        number=hash("FRANKREICH:{}".format(name)),
+        number=stable_number("FRANKREICH:{}".format(name)),
         codes=CodeTuple('🇫🇷' + code.upper()),
         station_category=category
     )
@@ -261,7 +218,7 @@ def stat_fr(name: str, code: str, category: int = 5) -> Station:
 def abzw_fr(name: str, code: str, latitude: float, longitude: float) -> Station:
     return Station(
         name=name,
-        number=hash("FRANKREICH:{}".format(name)),
+        number=stable_number("FRANKREICH:{}".format(name)),
         codes=CodeTuple("🇫🇷" + code.upper()),
         location=Location(
             latitude=latitude,
@@ -269,3 +226,78 @@ def abzw_fr(name: str, code: str, latitude: float, longitude: float) -> Station:
         ),
         kind='abzw'
     )
+
+
+# Stations that are missing in the French data
+manual_stations_fr: Tuple[Station, ...] = (
+    Station(
+        name="Baudrecourt",
+        number=stable_number('Baudrecourt'),
+        codes=CodeTuple("🇫🇷BDC"),
+        kind='abzw'
+    ),
+    Station(
+        name="Pasilly à Aisy",
+        number=stable_number("Pasilly à Aisy"),
+        codes=CodeTuple("🇫🇷PAI"),
+        location=Location(
+            latitude=47.68882057293988,
+            longitude=4.075627659435932
+        ),
+        kind='abzw'
+    ),
+    Station(
+        name="Moisenay (Crisenoy)",
+        number=stable_number("LGV Interconnexion Est -> Sud-Est"),
+        codes=CodeTuple("🇫🇷MOIS"),
+        location=Location(
+            latitude=48.576961786948054,
+            longitude=2.74276121315047
+        ),
+        kind='abzw'
+    ),
+    Station(
+        name="Jablines/Messy",
+        number=stable_number("Warum muss das alles so kompliziert sein?!"),
+        codes=CodeTuple("🇫🇷JAB"),
+        location=Location(
+            latitude=48.94902574095624,
+            longitude=2.7114885647354288
+        ),
+        kind='abzw'
+    ),
+    Station(
+        name="Vémars",
+        number=stable_number("Vemars"),
+        codes=CodeTuple("🇫🇷VEMARS"),
+        location=Location(
+            latitude=49.055763434522255,
+            longitude=2.5651358332731578
+        ),
+        kind='abzw'
+    ),
+    Station(
+        name="Eurotunnel UK-Terminal",
+        number=stable_number("EUROTUNNEL!!!!"),
+        codes=CodeTuple("🇬🇧ETUK"),
+        location=Location(
+            latitude=51.09612758903609,
+            longitude=1.139774590509386
+        )
+    ),
+    Station(
+        name="Montanay",
+        number=stable_number("FR:Montanay"),
+        codes=CodeTuple("🇫🇷MONT"),
+        location=Location(
+            latitude=45.8892271474285,
+            longitude=4.877505944798289
+        ),
+        kind='abzw'
+    ),
+    abzw_fr("Grenay", "GRNY", 45.649041949201745, 5.081229404359257),
+    abzw_fr("Bollène", "BLLN", 44.30218827489829, 4.7017237487605215),
+    stat_fr("Andilly", "ADY"),
+    stat_fr("Bourmont", "BMT"),
+    stat_fr("Thiaucourt", "THU", 8)
+)
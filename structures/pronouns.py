@@ -13,6 +13,21 @@ class Pronouns:
     articles: Optional[Pronouns] = field(default=None)
 
 
+# The articles are the same for every instance, so we only create them once
+der_des_dem_den = Pronouns(
+    nominative='der',
+    genitive='des',
+    dative='dem',
+    accusative='den'
+)
+die_der_der_die = Pronouns(
+    nominative='die',
+    genitive='der',
+    dative='der',
+    accusative='die'
+)
+
+
 class ErIhmPronouns(Pronouns):
     def __init__(self):
         super().__init__(
@@ -20,12 +35,7 @@ class ErIhmPronouns(Pronouns):
             genitive='des',
             dative='ihm',
             accusative='ihn',
-            articles=Pronouns(
-                nominative='der',
-                genitive='des',
-                dative='dem',
-                accusative='den'
-            )
+            articles=der_des_dem_den
         )
 
 
@@ -36,10 +46,5 @@ class SieIhrPronouns(Pronouns):
             genitive='ihr',
             dative='ihr',
             accusative='sie',
-            articles=Pronouns(
-                nominative='die',
-                genitive='der',
-                dative='der',
-                accusative='die'
-            )
+            articles=die_der_der_die
         )
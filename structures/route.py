@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import bisect
 import functools
+import itertools
 import logging
 from abc import ABCMeta
+from collections import Counter
 from dataclasses import dataclass, field
 from enum import Enum
 from functools import cached_property
@@ -24,6 +27,35 @@ class Path:
     route_numer: int
     tracks: Tuple[Track]
 
+    @cached_property
+    def sorted_tracks(self) -> Tuple[Track, ...]:
+        return tuple(sorted(self.tracks, key=lambda track: track.from_km))
+
+    @cached_property
+    def _from_kms(self) -> List[StreckenKilometer]:
+        return [track.from_km for track in self.sorted_tracks]
+
+    @cached_property
+    def _max_to_kms(self) -> List[StreckenKilometer]:
+        # The largest to_km up to (and including) each track, which is sorted even if to_km is not
+        return list(itertools.accumulate((track.to_km for track in self.sorted_tracks), max))
+
+    @cached_property
+    def predominant_track_properties(self) -> Tuple[bool, TrackKind]:
+        """The most common electrification and track kind of the path"""
+        # Ties go to the first track, and the order of self.tracks differs between runs
+        electrified = Counter(track.electrified for track in self.sorted_tracks).most_common(1)[0][0]
+        kind = Counter(track.kind for track in self.sorted_tracks).most_common(1)[0][0]
+        return electrified, kind
+
+    def tracks_at(self, km_start: StreckenKilometer, km_end: StreckenKilometer) -> List[Track]:
+        """Returns the tracks containing km_start or km_end"""
+        # All tracks before start_index end before km_start, all tracks from end_index on start after km_end
+        start_index = bisect.bisect_left(self._max_to_kms, km_start)
+        end_index = bisect.bisect_right(self._from_kms, km_end)
+        return [track for track in self.sorted_tracks[start_index:end_index]
+                if track.from_km <= km_start <= track.to_km or track.from_km <= km_end <= track.to_km]
+
 
 def merge_tracks(tracks: List[Track]) -> List[Path]:
     route_number_to_tracks: Dict[int, Set[Track]] = {}
@@ -63,7 +95,7 @@ class TcRoute:
     def from_route(route: Route, station_data: List[Station],
                    add_annotations: bool = False) -> TcRoute:
         # Because we add the last (i.e. least precise) codes first, the "better" ones will override them at the end
-        code_to_station = {code: station for code, station in iter_stations_by_codes_reverse(station_data)}
+        code_to_station = dict(iter_stations_by_codes_reverse(station_data))
         stations = [code_to_station[waypoint.code] if waypoint.code in code_to_station else invalid_station(waypoint.code)
                     for waypoint in route.waypoints if waypoint.is_stop]
         assert len(stations) > 1, f"Not enough stations: {stations}"
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import re
+import zlib
 from dataclasses import dataclass, field
 from functools import cached_property
 from typing import Optional, List, Iterable, Generator, Tuple, Set, Any, Dict, FrozenSet
@@ -67,6 +68,10 @@ class CodeTuple(Tuple[str]):
     def __add__(self, other):
         return CodeTuple(*self, *other)
 
+    def __reduce__(self):
+        # The codes are already expanded and sorted, so we don't want to pass them through __new__ again
+        return _code_tuple_from_codes, (tuple(self),)
+
     def __new__(cls, *args):
         if not len(args):
             return tuple.__new__(cls)
@@ -112,6 +117,15 @@ class CodeTuple(Tuple[str]):
             return 0
 
 
+def _code_tuple_from_codes(codes: Tuple[str, ...]) -> CodeTuple:
+    return tuple.__new__(CodeTuple, codes)
+
+
+def stable_number(value: str) -> int:
+    """A station number for stations without one, which (unlike hash()) is the same in every run"""
+    return zlib.crc32(value.encode('utf-8'))
+
+
 def iter_stations_by_codes(stations: List[Station]) -> Generator[Tuple[str, Station], None, None]:
     max_index = max((len(station.codes) for station in stations)) - 1
     for index in range(0, max_index + 1):
@@ -125,13 +139,14 @@ def iter_stations_by_codes_reverse(stations: List[Station]) -> Generator[Tuple[s
     max_index = max((len(station.codes) for station in stations)) - 1
     for index in range(max_index, -1, -1):
         for station in stations:
-            try:
-                yield station.codes[index], station
-            except IndexError:
-                pass
+            # Most stations only have a few codes, so checking the length is cheaper than catching the IndexError
+            codes = station.codes
+            if len(codes) > index:
+                yield codes[index], station
 
 
-@dataclass(frozen=True)
+# Stations are compared (and hashed) by identity, comparing all the fields is too slow for large lists
+@dataclass(frozen=True, eq=False)
 class Station:
     name: Optional[str] = field(default=None)
     # A station might have multiple codes like "UE P" and "UE"
@@ -199,6 +214,15 @@ class Station:
         return Station(**result)
 
 
+_station_cached_properties = [name for name, value in vars(Station).items() if isinstance(value, cached_property)]
+
+
+def clear_cached_properties(station: Station):
+    """Needs to be called before changing a station in place"""
+    for name in _station_cached_properties:
+        station.__dict__.pop(name, None)
+
+
 def merge_stations_on_first_code(stations: List[Station]) -> List[Station]:
     merged_stations: Dict[str, Station] = {}
     for station in stations:
@@ -255,7 +279,7 @@ def merge_stations(onto: List[Station],
                 # New station
                 merged_stations.append(new_station)
     else:
-        id_to_station = {code: station for code, station in iter_stations_by_codes_reverse(onto)}
+        id_to_station = dict(iter_stations_by_codes_reverse(onto))
         id_to_wip: Dict[str, Dict[str, Any]] = {}
         for new_station in new_data:
             code_in_stations = False
@@ -274,10 +298,10 @@ def merge_stations(onto: List[Station],
             if not code_in_stations:
                 # It's completely new, add it to the list
                 merged_stations.append(new_station)
-    # Add old, unchanged values
-    merged_stations.extend(remaining_stations)
+    # Add old, unchanged values (in their original order)
+    merged_stations.extend(station for station in onto if station in remaining_stations)
     # And then the modified/new ones
-    merged_stations.extend(set((Station(**new_station_data) for new_station_data in id_to_wip.values())))
+    merged_stations.extend(Station(**new_station_data) for new_station_data in id_to_wip.values())
 
     if not ignore_data_loss:
         assert len(merged_stations) >= len(onto), (len(merged_stations), len(onto))
@@ -344,6 +368,9 @@ class PathLocation:
     route_number: int
     lfd_km: StreckenKilometer
 
+    def __reduce__(self):
+        return PathLocation, (self.route_number, self.lfd_km)
+
 
 @dataclass(frozen=True)
 class Platform:
@@ -352,12 +379,19 @@ class Platform:
     # The station could be a station code, or a station number
     station: str | int
 
+    def __reduce__(self):
+        return Platform, (self.length, self.station)
+
 
 @dataclass(frozen=True)
 class StreckenKilometer:
+    __slots__ = 'lfd_km', 'correction'
     lfd_km: float
     correction: float
 
+    def __reduce__(self):
+        return StreckenKilometer, (self.lfd_km, self.correction)
+
     def __lt__(self, other: StreckenKilometer) -> bool:
         if self.lfd_km != other.lfd_km:
             return self.lfd_km < other.lfd_km
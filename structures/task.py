@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import operator
 from dataclasses import dataclass, field, InitVar
 from enum import Enum
-from typing import List, Dict, Any, Optional, Set
+from functools import cached_property, reduce
+from typing import List, Dict, Any, Optional, Set, Tuple
+from weakref import WeakKeyDictionary
 
 import networkx as nx
 
@@ -44,27 +47,46 @@ class Task:
             object.__setattr__(self, 'pathSuggestion', get_path_suggestion(graph, self.stations,
                                                                            config=path_suggestion_config))
 
-    def to_dict(self, add_suggestion: bool = False) -> Dict[str, Any]:
-        task = self.__dict__
-        task['neededCapacity'] = [
+    @cached_property
+    def _needed_capacity_dicts(self) -> List[Dict[str, Any]]:
+        return [
             {name: value for name, value in needed_capacity.__dict__.items() if value} for needed_capacity in
             self.neededCapacity
         ]
-        if not add_suggestion:
-            task.pop('pathSuggestion', None)
+
+    def to_dict(self, add_suggestion: bool = False) -> Dict[str, Any]:
+        # Build a new dict instead of changing the fields of this task
+        task = {
+            'name': self.name,
+            'descriptions': self.descriptions,
+            'stations': self.stations,
+            'neededCapacity': self._needed_capacity_dicts,
+            'group': self.group,
+            'service': self.service
+        }
+        if add_suggestion and self.pathSuggestion is not None:
+            task['pathSuggestion'] = self.pathSuggestion
         return task
 
     def uses_sfs(self, graph: nx.Graph) -> bool:
-        stations = get_shortest_path(graph, self.stations)
-        for station_from, station_to in zip(stations, stations[1:]):
-            edge = graph[station_from][station_to]
-            if 'group' not in edge:
-                # By default, the group is 0 or at least not 2
-                return False
-            if edge['group'] == 2:
-                return True
-        else:
+        stations = _cached_shortest_path(graph, self.stations)
+        if not stations:
             return False
+        # By default, the group is 0 or at least not 2
+        return any(graph[station_from][station_to].get('group') == 2
+                   for station_from, station_to in zip(stations, stations[1:]))
+
+
+# Many tasks share their stations, so we only compute the shortest path once per graph and stations
+_shortest_paths: WeakKeyDictionary[nx.Graph, Dict[Tuple[str, ...], Optional[List[str]]]] = WeakKeyDictionary()
+
+
+def _cached_shortest_path(graph: nx.Graph, stations: List[str]) -> Optional[List[str]]:
+    shortest_paths = _shortest_paths.setdefault(graph, {})
+    key = tuple(stations)
+    if key not in shortest_paths:
+        shortest_paths[key] = get_shortest_path(graph, stations)
+    return shortest_paths[key]
 
 
 class ServiceLevel(Enum):
@@ -89,51 +111,55 @@ class GattungTask(Task):
         )
     ]
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Only the line differs between the tasks of a class, so we prepare everything else once
+        gattung = cls.gattung
+        gattung_long = cls.gattung_long
+        accusative = cls.pronouns.articles.accusative
+        dative = cls.pronouns.articles.dative
+        cls._name_with_line = "{} {{line}} von %s nach %s".format(gattung)
+        cls._name_without_line = "{} von %s nach %s".format(gattung)
+        cls._descriptions_with_line = (
+            "Bringe {} {} der Linie {{line}} von %s nach %s.".format(accusative, gattung_long),
+            "Bring die Fahrgäste in {} {} {{line}} pünktlich nach %2$s.".format(dative, gattung),
+            "Fahre {} {} störungsfrei nach %2$s.".format(accusative, gattung)
+        )
+        cls._descriptions_without_line = (
+            "Bringe {} {} von %s nach %s.".format(accusative, gattung_long),
+            "Bring die Fahrgäste in {} {} pünktlich nach %2$s.".format(dative, gattung).replace('in dem', 'im'),
+            "Fahre {} {} störungsfrei nach %2$s.".format(accusative, gattung)
+        )
+        cls._sfs_description = "Bringe {} {} pünktlich über die SFS von %s nach %s".format(accusative, gattung_long)
+
     def __init__(self,
                  line: str,
                  line_name: Optional[str] = None,
                  name_pronouns: Optional[Pronouns] = None,
                  needed_capacities: List[TcNeededCapacity] | None = None,
                  *args, **kwargs):
+        cls = type(self)
         super().__init__(
             name="{} von %s nach %s".format(line_name) if line_name
-            else "{} {} von %s nach %s".format(self.__class__.gattung, line) if line
-            else "{} von %s nach %s".format(self.__class__.gattung),
+            else cls._name_with_line.format(line=line) if line
+            else cls._name_without_line,
             descriptions=self._generate_descriptions(line, line_name, name_pronouns),
-            neededCapacity=needed_capacities if needed_capacities is not None else self.__class__.needed_capacity,
-            service=self.__class__.service.value,
+            neededCapacity=needed_capacities if needed_capacities is not None else cls.needed_capacity,
+            service=cls.service.value,
             *args, **kwargs
         )
 
     def add_sfs_description(self, graph: nx.Graph):
         if self.uses_sfs(graph):
-            self.descriptions.append(
-                "Bringe {} {} pünktlich über die SFS von %s nach %s".format(self.__class__.pronouns.articles.accusative,
-                                                                            self.__class__.gattung_long)
-            )
+            self.descriptions.append(self._sfs_description)
 
     def _generate_descriptions(self, line: Optional[str] = None,
                                line_name: Optional[str] = None,
                                name_pronouns: Optional[Pronouns] = None) -> List[str]:
         if line:
-            descriptions = [
-                "Bringe {} {} der Linie {} von %s nach %s.".format(self.__class__.pronouns.articles.accusative,
-                                                                   self.__class__.gattung_long, line),
-                "Bring die Fahrgäste in {} {} {} pünktlich nach %2$s.".format(self.__class__.pronouns.articles.dative,
-                                                                              self.__class__.gattung, line),
-                "Fahre {} {} störungsfrei nach %2$s.".format(self.__class__.pronouns.articles.accusative,
-                                                             self.__class__.gattung)
-            ]
+            descriptions = [template.format(line=line) for template in self._descriptions_with_line]
         else:
-            descriptions = [
-                "Bringe {} {} von %s nach %s.".format(self.__class__.pronouns.articles.accusative,
-                                                      self.__class__.gattung_long),
-                "Bring die Fahrgäste in {} {} pünktlich nach %2$s.".format(self.__class__.pronouns.articles.dative,
-                                                                           self.__class__.gattung)
-                                                                    .replace('in dem', 'im'),
-                "Fahre {} {} störungsfrei nach %2$s.".format(self.__class__.pronouns.articles.accusative,
-                                                             self.__class__.gattung)
-            ]
+            descriptions = list(self._descriptions_without_line)
         if line_name and name_pronouns:
             descriptions.extend([
                 "Bring {} {} von %s nach %s.".format(name_pronouns.articles.accusative, line_name)
@@ -260,26 +286,28 @@ def merge_task_dicts(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                 if key not in task:
                     task[key] = None
         merged_tasks = [tasks[0]]
+        # Only tasks with equal group and neededCapacity can be merged, so we group them by these
+        buckets: Dict[Tuple, List[int]] = {_merge_key(tasks[0]): [0]}
         # try to merge the other tasks
         for task in tasks[1:]:
-            overlap = [0 for _ in merged_tasks]
+            bucket_key = _merge_key(task)
+            best_index = None
+            best_overlap = 0
             # Merge if at least group, and neededCapacity are equal and if there are no objects in the new task
-            for index, merge_task in enumerate(merged_tasks):
-                if 'objects' not in task \
-                   and task['group'] == merge_task['group'] \
-                   and task['neededCapacity'] == merge_task['neededCapacity']\
-                   and (
-                    task['name'] == merge_task['name']
-                    or task['descriptions'] == merge_task['descriptions']
-                    or task['stations'] == merge_task['stations']
-                   ):
-                    for key, value in task.items():
-                        if merge_task[key] == value:
-                            overlap[index] += 1
-            # Now we have a mapping from task index to overlap (i.e. shared properties)
-            # Merge with the best one
-            if max(overlap) != 0:
-                merge_task = merged_tasks[overlap.index(max(overlap))]
+            if 'objects' not in task:
+                for index in buckets.get(bucket_key, ()):
+                    merge_task = merged_tasks[index]
+                    if task['name'] == merge_task['name'] \
+                       or task['descriptions'] == merge_task['descriptions'] \
+                       or task['stations'] == merge_task['stations']:
+                        # group and neededCapacity are equal within a bucket, no need to compare them again
+                        overlap = sum(1 for key, value in task.items()
+                                      if key in _merge_key_properties or merge_task[key] == value)
+                        if overlap > best_overlap:
+                            best_index, best_overlap = index, overlap
+            # Merge with the best one (i.e. the one with the most shared properties)
+            if best_index is not None:
+                merge_task = merged_tasks[best_index]
                 if 'objects' not in merge_task:
                     merge_task['objects'] = []
                 sub_task: Dict[str, Any] = {}
@@ -290,27 +318,33 @@ def merge_task_dicts(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
                 merge_task['objects'].append(sub_task)
             else:
                 # No mergeable task found
+                buckets.setdefault(bucket_key, []).append(len(merged_tasks))
                 merged_tasks.append(task)
         for task in merged_tasks:
             cleanup_task(task)
     return merged_tasks
 
 
+_merge_key_properties = ('group', 'neededCapacity')
+
+
+def _merge_key(task: Dict[str, Any]) -> Tuple:
+    needed_capacity = task['neededCapacity']
+    if needed_capacity is not None:
+        needed_capacity = tuple(tuple(sorted(capacity.items())) for capacity in needed_capacity)
+    return task['group'], needed_capacity
+
+
 def cleanup_task(task: Dict[str, Any]):
-    for key, value in task.copy().items():
-        if value is None:
-            task.pop(key)
-    if 'objects' in task:
-        for task in task['objects']:
-            cleanup_task(task)
+    for key in [key for key, value in task.items() if value is None]:
+        del task[key]
+    for subtask in task.get('objects', ()):
+        cleanup_task(subtask)
 
 
 def extract_remaining_subtask_from_task(task: Dict[str, Any]):
     if 'objects' in task and task['objects']:
-        subtask_keys = (set(subtask.keys()) for subtask in task['objects'])
-        keys_in_all_subtasks = subtask_keys.__next__()
-        for other_subtask_keys in subtask_keys:
-            keys_in_all_subtasks.intersection_update(other_subtask_keys)
+        keys_in_all_subtasks = reduce(operator.and_, (subtask.keys() for subtask in task['objects']))
         new_subtask: Dict[str, Any] = {}
         for key in keys_in_all_subtasks:
             new_subtask[key] = task.pop(key)
@@ -5,6 +5,8 @@ import os.path
 from os import PathLike
 from typing import List, Any, Dict, Generator
 
+import orjson
+
 from tc_utils.formatting import format_json
 
 
@@ -17,11 +19,13 @@ class TcFile:
     def __init__(self, name: str, directory: PathLike | str = '..'):
         self.name = name
         self.path = os.path.join(directory, name) + '.json'
-        with open(self.path, encoding='utf-8') as data_file:
-            self.content = json.load(data_file)
+        # orjson parses considerably faster than json, which matters for the large Path.json
+        with open(self.path, 'rb') as data_file:
+            self.content = orjson.loads(data_file.read())
             self.data = self.content['data']
 
     def save(self):
+        # The files are indented with tabs, which orjson doesn't support
         with open(self.path, 'w', encoding='utf-8', newline='\n') as output_file:
             json.dump(self.content, output_file, ensure_ascii=False, indent='\t')
 
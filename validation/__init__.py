@@ -39,8 +39,7 @@ def validate(tc_directory: PathLike | str = '..',
     enforce_experimental = experimental == "enforce"
     enable_experimental = experimental != "false"
     data_set = DataSet.load_data(data_directory)
-    stations: Dict[str, Station] = {code: station
-                                    for code, station in iter_stations_by_codes_reverse(data_set.station_data)}
+    stations: Dict[str, Station] = dict(iter_stations_by_codes_reverse(data_set.station_data))
     path_json = TcFile('Path', tc_directory)
     station_json = TcFile('Station', tc_directory)
     train_json = TcFile('Train', tc_directory)